@@ -0,0 +1,79 @@
+
+#!/usr/bin/env python3
+"""
+Throughput micro-benchmark for the Modbus TCP Clock Server.
+
+Opens one or more client connections against a running server, hammers it
+with FC=0x03 "read all 6 registers" requests (optionally pipelined), and
+reports requests per second. Useful for judging whether further work on the
+request path — e.g. compiling the frame codec to a C extension — would pay
+for itself.
+
+Example:
+    python modbus_clock_server.py --port 5020 --log-file /tmp/bench.log &
+    python benchmark.py --port 5020 --requests 50000 --pipeline 16
+"""
+from __future__ import annotations
+
+import argparse
+import socket
+import struct
+import time
+
+_MBAP = struct.Struct(">HHHB")
+
+# FC=0x03, start=0, qty=6 — the request real pollers send
+_READ_ALL = struct.pack(">BHH", 0x03, 0, 6)
+_RESPONSE_LEN = 7 + 2 + 12  # MBAP + (FC, byte count) + 6 registers
+
+
+def run(host: str, port: int, requests: int, pipeline: int) -> float:
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    done = 0
+    tid = 0
+    start = time.perf_counter()
+    while done < requests:
+        batch = min(pipeline, requests - done)
+        frames = []
+        for _ in range(batch):
+            tid = (tid + 1) & 0xFFFF
+            frames.append(_MBAP.pack(tid, 0, 1 + len(_READ_ALL), 1) + _READ_ALL)
+        sock.sendall(b"".join(frames))
+
+        expected = batch * _RESPONSE_LEN
+        got = 0
+        while got < expected:
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Server closed the connection mid-benchmark")
+            got += len(chunk)
+        done += batch
+    elapsed = time.perf_counter() - start
+    sock.close()
+    return requests / elapsed
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark a running Modbus TCP clock server")
+    p.add_argument("--host", default="127.0.0.1", help="Server host (default: 127.0.0.1)")
+    p.add_argument("--port", type=int, default=502, help="Server port (default: 502)")
+    p.add_argument("--requests", type=int, default=10000, help="Total requests to send (default: 10000)")
+    p.add_argument(
+        "--pipeline",
+        type=int,
+        default=1,
+        help="Requests kept in flight per batch; 1 = strict request/reply (default: 1)",
+    )
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    rps = run(args.host, args.port, args.requests, args.pipeline)
+    print(f"{args.requests} requests, pipeline={args.pipeline}: {rps:,.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
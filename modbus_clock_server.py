@@ -23,17 +23,26 @@ Notes
 from __future__ import annotations
 
 import argparse
-import datetime as dt
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
+import selectors
 import socket
 import struct
 import threading
+import time
 from typing import Tuple
 
 # ---------------------------- Logging Setup ---------------------------- #
 
-def setup_logging(log_file: str, verbose: bool = True) -> None:
+def setup_logging(log_file: str, verbose: bool = True) -> QueueListener:
+    """Configure root logging; returns the listener draining the log queue.
+
+    Records are handed to an in-process queue and written by a background
+    QueueListener thread, so disk writes (and rotation renames) never block
+    the thread serving requests. Callers should stop() the returned listener
+    on shutdown to flush pending records.
+    """
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
 
@@ -42,54 +51,82 @@ def setup_logging(log_file: str, verbose: bool = True) -> None:
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
+    handlers = []
+
     # Console
     if verbose:
         ch = logging.StreamHandler()
         ch.setFormatter(fmt)
-        logger.addHandler(ch)
+        handlers.append(ch)
 
-    # Rotating file (5 MB per file, keep 5 backups)
-    fh = RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=5)
+    # Rotating file (5 MB per file, keep 5 backups); delay=True defers the
+    # open() until the first record reaches the listener thread.
+    fh = RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=5, delay=True)
     fh.setFormatter(fmt)
-    logger.addHandler(fh)
+    handlers.append(fh)
+
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(q))
+    listener = QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
 
 
 # ---------------------------- Helpers ---------------------------- #
 
 def hexdump(data: bytes, width: int = 16) -> str:
-    return " ".join(f"{b:02X}" for b in data)
+    # bytes.hex(sep) does the per-byte formatting in C, far cheaper than a
+    # Python-level generator + f-string per byte.
+    return data.hex(" ").upper()
 
 
-def recv_exact(sock: socket.socket, n: int) -> bytes:
-    """Receive exactly n bytes or raise ConnectionError if the stream closes."""
-    chunks = []
-    bytes_recd = 0
-    while bytes_recd < n:
-        chunk = sock.recv(n - bytes_recd)
-        if not chunk:
-            raise ConnectionError("Socket closed while receiving data")
-        chunks.append(chunk)
-        bytes_recd += len(chunk)
-    return b"".join(chunks)
+# How much to ask the kernel for per recv(); large enough to pull a whole
+# burst of pipelined requests in one syscall.
+RECV_CHUNK = 4096
 
 
 # ---------------------------- Clock Data ---------------------------- #
 
-def read_clock_registers(start: int, count: int) -> Tuple[int, ...]:
+# The registers only carry second-level resolution, so re-reading the system
+# clock on every request is wasted work when many clients poll concurrently.
+# Cache the register tuple and refresh it at most every CLOCK_REFRESH seconds.
+CLOCK_REFRESH = 0.25
+
+_clock_cache: list = [0.0, ()]  # [monotonic deadline, register tuple]
+_clock_lock = threading.Lock()
+
+
+def _current_registers() -> Tuple[int, ...]:
+    """Return the cached 6-register clock tuple, refreshing it if stale."""
+    now_m = time.monotonic()
+    deadline, registers = _clock_cache
+    if now_m >= deadline:
+        with _clock_lock:
+            # Another thread may have refreshed while we waited for the lock.
+            deadline, registers = _clock_cache
+            if now_m >= deadline:
+                now = time.localtime()
+                registers = (
+                    now.tm_mday,
+                    now.tm_mon,
+                    now.tm_year,
+                    now.tm_hour,
+                    now.tm_min,
+                    now.tm_sec,
+                )
+                _clock_cache[:] = [now_m + CLOCK_REFRESH, registers]
+    return registers
+
+
+def read_clock_registers(start: int, count: int, now_regs: Tuple[int, ...] = None) -> Tuple[int, ...]:
     """Return a tuple of register values from the live system clock.
 
     This server exposes 6 holding registers starting at address 0.
     Requests beyond that range raise an IndexError to signal illegal address.
+    Callers serving a batch of requests can capture _current_registers() once
+    and pass it as `now_regs` so the whole batch reads the same instant.
     """
-    now = dt.datetime.now()
-    registers = (
-        now.day,
-        now.month,
-        now.year,
-        now.hour,
-        now.minute,
-        now.second,
-    )
+    registers = now_regs if now_regs is not None else _current_registers()
 
     end = start + count
     if start < 0 or end > len(registers):
@@ -99,126 +136,315 @@ def read_clock_registers(start: int, count: int) -> Tuple[int, ...]:
 
 # ---------------------------- Modbus Protocol ---------------------------- #
 
+# Response builders return MBAP header and PDU as one contiguous bytes object,
+# and the send path writes each burst of responses with a single (scatter-
+# gather) send — with TCP_NODELAY set that means one syscall and one TCP
+# segment per burst. Some buggy clients choke if header and body arrive in
+# separate segments; keep it that way.
+
 # Exception codes
 ILLEGAL_FUNCTION = 0x01
 ILLEGAL_DATA_ADDRESS = 0x02
 ILLEGAL_DATA_VALUE = 0x03
 
+# Precompiled wire formats — parsing a format string on every call is wasted
+# work in the innermost request loop.
+_MBAP = struct.Struct(">HHHB")      # transaction id, protocol id, length, unit id
+_FC3_REQ = struct.Struct(">HH")     # start address, quantity
+
+# An exception PDU is just two fixed bytes (function | 0x80, code). Precompute
+# the pairs for the standard function codes so error storms from scanners and
+# broken clients never touch struct at all; anything exotic falls back to the
+# bytes() constructor.
+_EXC_PDUS = {
+    (f | 0x80, code): bytes((f | 0x80, code))
+    for f in (0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x0F, 0x10)
+    for code in (ILLEGAL_FUNCTION, ILLEGAL_DATA_ADDRESS, ILLEGAL_DATA_VALUE)
+}
+
 
 def build_exception_response(transaction_id: int, protocol_id: int, unit_id: int, function: int, ex_code: int) -> bytes:
-    pdu = struct.pack("BB", function | 0x80, ex_code)
-    # Length field = UnitId(1) + PDU length
-    length = 1 + len(pdu)
-    mbap = struct.pack(">HHHB", transaction_id, protocol_id, length, unit_id)
+    key = (function | 0x80, ex_code)
+    pdu = _EXC_PDUS.get(key) or bytes(key)
+    # Length field = UnitId(1) + PDU(2)
+    mbap = _MBAP.pack(transaction_id, protocol_id, 3, unit_id)
     return mbap + pdu
 
 
+# FC=0x03 response PDUs (function + byte count + N big-endian registers) are
+# packed in one Struct call; the compiled formats are cached per register count.
+_FC3_FMTS: dict = {}
+
+
 def build_fc3_response(transaction_id: int, protocol_id: int, unit_id: int, values: Tuple[int, ...]) -> bytes:
-    byte_count = len(values) * 2
-    pdu_header = struct.pack("BB", 0x03, byte_count)
-    # Each register is 2 bytes, big-endian
-    regs = b"".join(struct.pack(">H", v & 0xFFFF) for v in values)
-    pdu = pdu_header + regs
+    n = len(values)
+    fmt = _FC3_FMTS.get(n) or _FC3_FMTS.setdefault(n, struct.Struct(">BB" + "H" * n))
+    pdu = fmt.pack(0x03, n * 2, *(v & 0xFFFF for v in values))
     length = 1 + len(pdu)  # UnitId + PDU
-    mbap = struct.pack(">HHHB", transaction_id, protocol_id, length, unit_id)
+    mbap = _MBAP.pack(transaction_id, protocol_id, length, unit_id)
     return mbap + pdu
 
 
 def parse_mbap_header(hdr: bytes) -> Tuple[int, int, int, int]:
-    transaction_id, protocol_id, length, unit_id = struct.unpack(">HHHB", hdr)
+    transaction_id, protocol_id, length, unit_id = _MBAP.unpack(hdr)
     return transaction_id, protocol_id, length, unit_id
 
 
 # ---------------------------- Client Handler ---------------------------- #
 
-def handle_client(conn: socket.socket, addr: Tuple[str, int], log: logging.Logger) -> None:
-    peer = f"{addr[0]}:{addr[1]}"
-    log.info(f"Client connected: {peer}")
+# Virtually every real client polls "read all six registers". Memoize that
+# whole response frame and patch in the per-request MBAP fields, so the common
+# case is a copy plus one pack_into instead of a full rebuild. The frame is
+# invalidated whenever the cached clock tuple changes.
+_FC3_ALL = [(), b""]  # [register tuple the frame encodes, frame bytes]
+
+
+def _fc3_all_response(transaction_id: int, protocol_id: int, unit_id: int, now_regs: Tuple[int, ...] = None) -> bytes:
+    vals = read_clock_registers(0, 6, now_regs)
+    cached_vals, frame = _FC3_ALL
+    if vals != cached_vals:
+        frame = build_fc3_response(0, 0, 0, vals)
+        _FC3_ALL[:] = [vals, frame]
+    resp = bytearray(frame)
+    _MBAP.pack_into(resp, 0, transaction_id, protocol_id, len(frame) - 6, unit_id)
+    return bytes(resp)
+
+
+def _handle_fc3(transaction_id: int, protocol_id: int, unit_id: int, pdu: bytes, peer: str, log: logging.Logger, now_regs: Tuple[int, ...] = None) -> bytes:
+    """Serve FC=0x03 (Read Holding Registers) and return the response frame."""
+    if len(pdu) != 5:
+        # Malformed length
+        return build_exception_response(transaction_id, protocol_id, unit_id, 0x03, ILLEGAL_DATA_VALUE)
+    # unpack_from avoids slicing a temporary bytes object
+    start_addr, qty = _FC3_REQ.unpack_from(pdu, 1)
+    if log.isEnabledFor(logging.INFO):
+        log.info(
+            "Parsed FC=0x03 from %s | Start=%d Qty=%d",
+            peer,
+            start_addr,
+            qty,
+        )
+    if qty < 1 or qty > 125:
+        return build_exception_response(transaction_id, protocol_id, unit_id, 0x03, ILLEGAL_DATA_VALUE)
+    if start_addr == 0 and qty == 6:
+        return _fc3_all_response(transaction_id, protocol_id, unit_id, now_regs)
     try:
-        while True:
-            # Read MBAP (7 bytes)
-            hdr = recv_exact(conn, 7)
-            transaction_id, protocol_id, length, unit_id = parse_mbap_header(hdr)
-            # Read remaining bytes (length includes UnitId + PDU). We already read UnitId in hdr (1 byte),
-            # so remaining PDU bytes = length - 1
-            pdu = recv_exact(conn, length - 1)
-
-            # Log raw request
-            raw = hdr + pdu
-            logging.info(
+        vals = read_clock_registers(start_addr, qty, now_regs)
+    except IndexError:
+        return build_exception_response(transaction_id, protocol_id, unit_id, 0x03, ILLEGAL_DATA_ADDRESS)
+    return build_fc3_response(transaction_id, protocol_id, unit_id, vals)
+
+
+# Function-code dispatch table: adding a new FC is one handler + one entry,
+# and the hot path stays a single dict lookup instead of a branch chain.
+_FC_HANDLERS = {
+    0x03: _handle_fc3,
+}
+
+
+class _Connection:
+    """Per-connection state tracked by the event loop."""
+
+    __slots__ = ("sock", "peer", "rxbuf", "txbuf")
+
+    def __init__(self, sock: socket.socket, peer: str) -> None:
+        self.sock = sock
+        self.peer = peer
+        # Persistent receive buffer: one recv() may deliver several pipelined
+        # MBAP+PDU frames, which are all drained before the next syscall.
+        self.rxbuf = bytearray()
+        # Bytes accepted but not yet taken by the kernel (short send()).
+        self.txbuf = bytearray()
+
+
+def _drain_frames(state: _Connection, log: logging.Logger) -> list:
+    """Parse every complete MBAP+PDU frame in state.rxbuf; return responses.
+
+    Raises ConnectionError on a malformed (empty-PDU) frame so the caller
+    drops the connection, matching the old blocking handler's behavior.
+    """
+    # Bound as locals: each of these is touched once or more per frame, and
+    # LOAD_FAST beats the global/attribute lookups in the tightest loop we have.
+    log_info = log.info
+    log_enabled = log.isEnabledFor
+    rxbuf = state.rxbuf
+    peer = state.peer
+    mbap_unpack = _MBAP.unpack_from
+    get_handler = _FC_HANDLERS.get
+    build_exc = build_exception_response
+    info_level = logging.INFO
+    out = []
+    out_append = out.append
+    # Frames in one burst arrived together; they all see the same clock
+    # reading, captured lazily on the first dispatched frame.
+    now_regs = None
+    while len(rxbuf) >= 7:
+        transaction_id, protocol_id, length, unit_id = mbap_unpack(rxbuf)
+        # Length counts UnitId + PDU; the full frame is 6 MBAP bytes
+        # (everything before UnitId) plus `length` bytes.
+        frame_end = 6 + length
+        if len(rxbuf) < frame_end:
+            break  # wait for the rest of this frame
+        pdu = bytes(rxbuf[7:frame_end])
+
+        # Log raw request — skip even the hexdump when INFO is filtered
+        if log_enabled(info_level):
+            log_info(
                 "Request from %s | TID=%d UID=%d RAW=%s",
                 peer,
                 transaction_id,
                 unit_id,
-                hexdump(raw),
+                hexdump(rxbuf[:frame_end]),
+            )
+        del rxbuf[:frame_end]
+
+        if not pdu:
+            raise ConnectionError("Empty PDU received")
+
+        function = pdu[0]
+
+        handler = get_handler(function)
+        if handler is not None:
+            if now_regs is None:
+                now_regs = _current_registers()
+            out_append(handler(transaction_id, protocol_id, unit_id, pdu, peer, log, now_regs))
+        else:
+            # Unsupported function
+            log_info(
+                "Unsupported FC=0x%02X from %s — replying with Illegal Function",
+                function,
+                peer,
             )
+            out_append(build_exc(transaction_id, protocol_id, unit_id, function, ILLEGAL_FUNCTION))
+    return out
 
-            if not pdu:
-                raise ConnectionError("Empty PDU received")
-
-            function = pdu[0]
-
-            # Function 0x03: Read Holding Registers
-            if function == 0x03:
-                if len(pdu) != 5:
-                    # Malformed length
-                    resp = build_exception_response(transaction_id, protocol_id, unit_id, function, ILLEGAL_DATA_VALUE)
-                    conn.sendall(resp)
-                    continue
-                start_addr, qty = struct.unpack(">HH", pdu[1:5])
-                logging.info(
-                    "Parsed FC=0x03 from %s | Start=%d Qty=%d",
-                    peer,
-                    start_addr,
-                    qty,
-                )
-                if qty < 1 or qty > 125:
-                    resp = build_exception_response(transaction_id, protocol_id, unit_id, function, ILLEGAL_DATA_VALUE)
-                    conn.sendall(resp)
-                    continue
-                try:
-                    vals = read_clock_registers(start_addr, qty)
-                except IndexError:
-                    resp = build_exception_response(transaction_id, protocol_id, unit_id, function, ILLEGAL_DATA_ADDRESS)
-                    conn.sendall(resp)
-                    continue
-                resp = build_fc3_response(transaction_id, protocol_id, unit_id, vals)
-                conn.sendall(resp)
-            else:
-                # Unsupported function
-                logging.info(
-                    "Unsupported FC=0x%02X from %s — replying with Illegal Function",
-                    function,
-                    peer,
-                )
-                resp = build_exception_response(transaction_id, protocol_id, unit_id, function, ILLEGAL_FUNCTION)
-                conn.sendall(resp)
 
-    except (ConnectionError, OSError) as e:
-        log.info(f"Client disconnected: {peer} ({e})")
-    finally:
+# ---------------------------- Server ---------------------------- #
+
+def _accept_client(sel: selectors.BaseSelector, listener: socket.socket, log: logging.Logger) -> None:
+    try:
+        conn, addr = listener.accept()
+    except BlockingIOError:
+        return  # raced another readiness notification
+    conn.setblocking(False)
+    # Modbus is a small-frame request/reply protocol; disable Nagle so each
+    # response ships immediately instead of waiting for more data to coalesce.
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # Reap peers that vanish without a FIN (pulled cable, crashed HMI).
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    peer = f"{addr[0]}:{addr[1]}"
+    log.info("Client connected: %s", peer)
+    sel.register(conn, selectors.EVENT_READ, _Connection(conn, peer))
+
+
+def _close_client(sel: selectors.BaseSelector, state: _Connection, log: logging.Logger, reason: object) -> None:
+    log.info("Client disconnected: %s (%s)", state.peer, reason)
+    try:
+        sel.unregister(state.sock)
+    except (KeyError, ValueError):
+        pass
+    try:
+        state.sock.close()
+    except OSError:
+        pass
+
+
+# sendmsg is missing on Windows; fall back to joining frames there.
+_HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+
+def _queue_frames(state: _Connection, frames: list) -> None:
+    """Hand response frames to the kernel, buffering whatever it won't take.
+
+    With sendmsg available and nothing already queued, the frames go out in
+    one scatter-gather syscall and one TCP segment without being concatenated
+    in Python first; any unsent tail lands in txbuf for _flush to finish.
+    """
+    if _HAS_SENDMSG and not state.txbuf:
         try:
-            conn.close()
-        except Exception:
-            pass
+            sent = state.sock.sendmsg(frames)
+        except BlockingIOError:
+            sent = 0
+        for buf in frames:
+            if sent >= len(buf):
+                sent -= len(buf)
+                continue
+            state.txbuf += buf[sent:] if sent else buf
+            sent = 0
+        return
+    state.txbuf += frames[0] if len(frames) == 1 else b"".join(frames)
+
+
+def _flush(sel: selectors.BaseSelector, state: _Connection) -> None:
+    """Push txbuf to the kernel; watch EVENT_WRITE only while bytes remain."""
+    sock = state.sock
+    txbuf = state.txbuf
+    while txbuf:
+        try:
+            sent = sock.send(txbuf)
+        except BlockingIOError:
+            break
+        del txbuf[:sent]
+    events = selectors.EVENT_READ
+    if txbuf:
+        events |= selectors.EVENT_WRITE
+    sel.modify(sock, events, state)
 
 
-# ---------------------------- Server ---------------------------- #
+def _service_client(sel: selectors.BaseSelector, state: _Connection, events: int, log: logging.Logger) -> None:
+    try:
+        if events & selectors.EVENT_READ:
+            data = state.sock.recv(RECV_CHUNK)
+            if not data:
+                _close_client(sel, state, log, "connection closed by peer")
+                return
+            state.rxbuf += data
+            out = _drain_frames(state, log)
+            # One send() per recv burst, no matter how many frames it carried
+            if out:
+                _queue_frames(state, out)
+        if state.txbuf or events & selectors.EVENT_WRITE:
+            _flush(sel, state)
+    except (ConnectionError, OSError) as e:
+        _close_client(sel, state, log, e)
+
 
 def serve(host: str, port: int, log_file: str) -> None:
-    setup_logging(log_file)
+    log_listener = setup_logging(log_file)
     log = logging.getLogger(__name__)
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((host, port))
-        s.listen()
-        log.info(f"Modbus TCP Clock Server listening on {host}:{port}")
-        log.info("Registers exposed (0-based): 0=Day, 1=Month, 2=Year, 3=Hour, 4=Minute, 5=Second")
-        while True:
-            conn, addr = s.accept()
-            t = threading.Thread(target=handle_client, args=(conn, addr, log), daemon=True)
-            t.start()
+    # Fold the non-blocking and close-on-exec flags into the socket type where
+    # the platform supports it (Linux >= 2.6.28): the FD comes back from the
+    # kernel already configured, with no follow-up fcntl()/ioctl() syscalls.
+    sock_type = (
+        socket.SOCK_STREAM
+        | getattr(socket, "SOCK_NONBLOCK", 0)
+        | getattr(socket, "SOCK_CLOEXEC", 0)
+    )
+
+    sel = selectors.DefaultSelector()
+    try:
+        with socket.socket(socket.AF_INET, sock_type) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((host, port))
+            s.listen()
+            # No-op where SOCK_NONBLOCK applied at creation; needed elsewhere.
+            s.setblocking(False)
+            # The listener is registered with data=None; connections carry
+            # their _Connection state instead.
+            sel.register(s, selectors.EVENT_READ, None)
+            log.info("Modbus TCP Clock Server listening on %s:%d", host, port)
+            log.info("Registers exposed (0-based): 0=Day, 1=Month, 2=Year, 3=Hour, 4=Minute, 5=Second")
+            log.info("Serving connections on a single-threaded selector event loop")
+            while True:
+                for key, events in sel.select():
+                    if key.data is None:
+                        _accept_client(sel, s, log)
+                    else:
+                        _service_client(sel, key.data, events, log)
+    finally:
+        sel.close()
+        log_listener.stop()  # flush queued records before exiting
 
 
 # ---------------------------- CLI ---------------------------- #